@@ -4,8 +4,14 @@ Features: Schüler/Fächer/Noten-Verwaltung • Deutsche Tendenz-Noten mit Dropd
 """
 
 import streamlit as st
-import json
+import atexit
+import itertools
+import orjson
 import os
+import sys
+import threading
+import time
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import plotly.express as px
@@ -16,6 +22,10 @@ from io import StringIO
 # ────────────────────────────────────────────────
 
 DATA_FILE = "noten_db.json"
+LOG_FILE = "noten_db.log"          # Änderungen seit dem letzten Snapshot
+LOG_COMPACT_MIN_BYTES = 64 * 1024
+AUTOSAVE_SECONDS = 30                # ungespeicherte Änderungen spätestens dann schreiben (solange der Tab offen ist)
+AUTOSAVE_CHECK_SECONDS = 5           # Takt der Prüfung, muss kleiner als AUTOSAVE_SECONDS sein
 
 NOTE_TEXT_TO_DECIMAL = {
     "1+": 0.7, "1": 1.0, "1-": 1.3,
@@ -26,8 +36,13 @@ NOTE_TEXT_TO_DECIMAL = {
     "6":  6.0
 }
 
+DECIMAL_TO_NOTE = {v: k for k, v in NOTE_TEXT_TO_DECIMAL.items()}
+
 ALL_GRADE_OPTIONS = list(NOTE_TEXT_TO_DECIMAL.keys())
 
+# Aufsteigend sortierte Dezimalwerte (gleiche Reihenfolge wie ALL_GRADE_OPTIONS)
+GRADE_DECIMALS = np.array(list(NOTE_TEXT_TO_DECIMAL.values()))
+
 # Farben für Noten
 def get_note_color(decimal_grade):
     if decimal_grade < 2.0:
@@ -43,38 +58,257 @@ def get_note_color(decimal_grade):
 #   Daten laden / speichern
 # ────────────────────────────────────────────────
 
-def load_data():
-    if os.path.exists(DATA_FILE):
+@st.cache_resource
+def database():
+    """Prozessweiter Zustand der DB-Dateien, geteilt von allen Sitzungen
+
+    revisions: neueste geschriebene Revision je Schüler-ID (auch gelöschte)
+    pending:   Sitzungen mit ungespeicherten Änderungen → beim Beenden schreiben
+    set_aside: wohin eine unlesbare DB beim Start verschoben wurde (sonst None)
+    """
+    repair_log()
+    set_aside = None
+    try:
+        generation, revisions, _ = read_disk()
+    except ValueError:
+        # Unlesbaren Snapshot samt Log beiseitelegen und mit leerer DB neu anfangen
+        set_aside = f"{DATA_FILE}.defekt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        os.replace(DATA_FILE, set_aside)
+        if os.path.exists(LOG_FILE):
+            os.replace(LOG_FILE, set_aside + ".log")
+        generation, revisions = 0, {}
+    store = {"lock": threading.Lock(), "generation": generation, "revisions": revisions,
+             "pending": {}, "set_aside": set_aside}
+    if set_aside:
+        save_data({}, {}, store)
+    atexit.register(flush_pending, store)
+    return store
+
+def read_snapshot():
+    """(Generation, Revisionen, Schülerdaten) aus DATA_FILE; Dateien ohne Kopf zählen als Generation 0"""
+    if not os.path.exists(DATA_FILE):
+        return 0, {}, {}
+    with open(DATA_FILE, "rb") as f:
+        snapshot = orjson.loads(f.read())
+    if not isinstance(snapshot, dict):
+        raise ValueError(f"{DATA_FILE} enthält kein JSON-Objekt")
+    if "students" in snapshot and snapshot.keys() <= {"generation", "revisions", "students"}:
+        return snapshot["generation"], snapshot.get("revisions", {}), snapshot["students"]
+    return 0, {}, snapshot
+
+def read_disk():
+    """Aktueller Stand auf der Platte: Snapshot plus nachgespieltes Log"""
+    generation, revisions, data = read_snapshot()
+    replay_log(data, revisions, generation)
+    return generation, revisions, data
+
+def load_data(store):
+    """(Schülerdaten, Revisionen) für eine neue Sitzung"""
+    if store["set_aside"]:
+        st.warning(f"Datenbank war beschädigt → nach {store['set_aside']} verschoben, neue leere DB erstellt")
+    with store["lock"]:
         try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+            _, revisions, data = read_disk()
         except:
             st.warning("Fehler beim Lesen der Datenbank → neue leere DB erstellt")
-            return {}
-    return {}
-
-def save_data(data):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+            return {}, {}
+    intern_subjects(data)
+    return data, revisions
+
+def replay_log(data, revisions, generation):
+    """Änderungen aus LOG_FILE, die noch nicht im Snapshot sind, nachspielen"""
+    if not os.path.exists(LOG_FILE):
+        return
+    with open(LOG_FILE, "rb") as f:
+        for line in f:
+            try:
+                line_generation, sid, revision, student = orjson.loads(line)
+            except ValueError:
+                continue    # abgebrochener Eintrag – spätere Zeilen trotzdem lesen
+            # Ältere Generation: schon im Snapshot (Absturz vor dem Löschen des Logs)
+            if line_generation < generation or revision <= revisions.get(sid, 0):
+                continue
+            revisions[sid] = revision
+            if student is None:
+                data.pop(sid, None)
+            else:
+                data[sid] = student
+
+def intern_subjects(data):
+    """Fach-Keys und -Namen internieren → ein gemeinsamer String pro Fach statt einer Kopie pro Schüler"""
+    for s in data.values():
+        subjects = s.get("subjects", {})
+        for subj in subjects.values():
+            subj["name"] = sys.intern(subj["name"])
+        s["subjects"] = {sys.intern(k): v for k, v in subjects.items()}
+
+def save_data(data, revisions, store):
+    # Aufruf nur mit store["lock"]. Erst in Temp-Datei schreiben, dann ersetzen
+    # → nie halb geschriebene DB. Log-Zeilen der alten Generation gelten danach
+    # als überholt, auch falls das Löschen unten nicht mehr passiert.
+    generation = store["generation"] + 1
+    tmp_file = DATA_FILE + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(orjson.dumps(
+            {"generation": generation, "revisions": revisions, "students": data},
+            option=orjson.OPT_INDENT_2
+        ))
+    os.replace(tmp_file, DATA_FILE)
+    store["generation"] = generation
+    # Snapshot enthält alles → Log wird nicht mehr gebraucht
+    if os.path.exists(LOG_FILE):
+        os.remove(LOG_FILE)
+
+def repair_log():
+    """Abgebrochenen letzten Eintrag (ohne Zeilenende) abschneiden, damit Neues nicht daran klebt"""
+    if not os.path.exists(LOG_FILE):
+        return
+    with open(LOG_FILE, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        f.seek(0)
+        f.truncate(f.read().rfind(b"\n") + 1)
+
+def append_log(entries):
+    # Eine Zeile pro Schüler: [Generation, ID, Revision, kompletter Datensatz oder None = gelöscht]
+    repair_log()
+    with open(LOG_FILE, "ab") as f:
+        f.write(b"".join(orjson.dumps(entry) + b"\n" for entry in entries))
+
+def mark_dirty(*student_ids):
+    """Nach jeder Änderung mit den geänderten Schüler-IDs aufrufen: Caches invalidieren, Speichern vormerken"""
+    st.session_state.data_version += 1
+    save_state = st.session_state.save_state
+    if not save_state["dirty"]:
+        save_state["dirty_since"] = time.monotonic()
+    save_state["dirty"] = True
+    save_state["changed"].update(student_ids)
+    database()["pending"][id(save_state)] = (st.session_state.data, st.session_state.revisions, save_state)
+
+def write_changes(data, revisions, save_state, store):
+    """Geänderte Schüler ans Log anhängen; gibt die übersprungenen IDs zurück
+
+    Ein Schüler wird nur geschrieben, wenn seit dem Laden keine andere Sitzung
+    eine neuere Revision gespeichert hat – veraltete Stände überschreiben nie
+    Neueres. Ohne st.session_state, damit es auch beim Beenden des Servers läuft.
+    """
+    if not save_state["dirty"]:
+        return []
+    skipped = []
+    with store["lock"]:
+        entries = []
+        for sid in save_state["changed"]:
+            disk_revision = store["revisions"].get(sid, 0)
+            if revisions.get(sid, 0) != disk_revision:
+                skipped.append(sid)
+                continue
+            entries.append([store["generation"], sid, disk_revision + 1, data.get(sid)])
+        append_log(entries)
+        # Revisionen erst hochzählen, wenn die Zeilen wirklich im Log stehen
+        for _, sid, revision, _ in entries:
+            revisions[sid] = store["revisions"][sid] = revision
+        store["pending"].pop(id(save_state), None)
+        save_state.update(dirty=False, changed=set())
+
+        # Log höchstens so groß wie der Snapshot werden lassen, dann aus dem
+        # Stand auf der Platte (nicht dem dieser Sitzung) kompaktieren
+        snapshot_size = os.path.getsize(DATA_FILE) if os.path.exists(DATA_FILE) else 0
+        if os.path.getsize(LOG_FILE) > max(snapshot_size, LOG_COMPACT_MIN_BYTES):
+            try:
+                _, disk_revisions, disk_data = read_disk()
+            except ValueError:
+                # Snapshot erst nach dem Start unlesbar geworden → Log behalten,
+                # der nächste Start legt beides beiseite
+                return skipped
+            save_data(disk_data, disk_revisions, store)
+    return skipped
+
+def flush_pending(store):
+    # Beim Beenden des Servers: alle Sitzungen mit ungespeicherten Änderungen
+    for data, revisions, save_state in list(store["pending"].values()):
+        write_changes(data, revisions, save_state, store)
+
+def flush_data():
+    data = st.session_state.data
+    skipped = write_changes(data, st.session_state.revisions, st.session_state.save_state, database())
+    if skipped:
+        names = ", ".join(data[sid]["name"] if sid in data else sid for sid in skipped)
+        st.warning(f"Nicht gespeichert, inzwischen in einer anderen Sitzung geändert (Seite neu laden): {names}")
 
 # ────────────────────────────────────────────────
 #   Berechnungen
 # ────────────────────────────────────────────────
 
-def calculate_subject_average(grades):
-    if not grades:
-        return None
-    return round(sum(grades) / len(grades), 2)
-
-def calculate_student_average(subjects_data):
-    subject_avgs = []
-    for subj in subjects_data.values():
-        avg = calculate_subject_average(subj.get("grades", []))
-        if avg is not None:
-            subject_avgs.append(avg)
-    if not subject_avgs:
-        return None
-    return round(sum(subject_avgs) / len(subject_avgs), 2)
+def calculate_all_averages(data):
+    """Fach- und Schülerdurchschnitte sowie Notenverteilung aller Schüler auf einmal
+
+    Rückgabe: ({id: avg}, {(id, fach_key): avg}, Anzahl je Note). Fachschnitt =
+    round(sum/len, 2) der Noten, Schülerschnitt = dasselbe über die Fachschnitte;
+    Fächer ohne Noten zählen nicht und fehlen im zweiten dict. Anzahlen in der
+    Reihenfolge von ALL_GRADE_OPTIONS.
+    """
+    student_avgs = dict.fromkeys(data)
+    subject_avgs = {}
+    grade_lists = []
+    for sid, s in data.items():
+        avgs = []
+        for subj_key, subj in s.get("subjects", {}).items():
+            grades = subj.get("grades")
+            if grades:
+                grade_lists.append(grades)
+                avg = subject_avgs[(sid, subj_key)] = round(sum(grades) / len(grades), 2)
+                avgs.append(avg)
+        if avgs:
+            student_avgs[sid] = round(sum(avgs) / len(avgs), 2)
+
+    flat = np.fromiter(itertools.chain.from_iterable(grade_lists), dtype=float)
+    grade_counts = np.bincount(np.searchsorted(GRADE_DECIMALS, flat), minlength=len(GRADE_DECIMALS))
+    return student_avgs, subject_avgs, grade_counts
+
+def versioned_cache(key, build):
+    """Ergebnis von build() in st.session_state[key], neu berechnet nur nach Datenänderungen."""
+    cache = st.session_state.get(key)
+    if cache is None or cache["version"] != st.session_state.data_version:
+        cache = {"version": st.session_state.data_version, "value": build()}
+        st.session_state[key] = cache
+    return cache["value"]
+
+def cached_aggregates():
+    return versioned_cache("avg_cache", lambda: calculate_all_averages(st.session_state.data))
+
+def cached_student_averages():
+    """Schülerdurchschnitte {id: avg}"""
+    return cached_aggregates()[0]
+
+def cached_subject_averages():
+    """Fachdurchschnitte {(id, fach_key): avg}"""
+    return cached_aggregates()[1]
+
+def cached_grade_counts():
+    """Anzahl je Note über alle Schüler und Fächer (Reihenfolge wie ALL_GRADE_OPTIONS)"""
+    return cached_aggregates()[2]
+
+def cached_names_lower():
+    """Kleingeschriebene Schülernamen {id: name} für die Suche"""
+    return versioned_cache("name_lower", lambda: {
+        sid: s.get("name", "—").lower()
+        for sid, s in st.session_state.data.items()
+    })
+
+def cached_student_options():
+    """Auswahlliste für die Schüler-Selectbox und {id: Position in der Liste}"""
+    def build():
+        options = ["Neuen Schüler anlegen"]
+        index_of = {}
+        for sid, s in st.session_state.data.items():
+            index_of[sid] = len(options)
+            options.append(f"{s['name']} ({sid})")
+        return options, index_of
+    return versioned_cache("options_cache", build)
 
 def grade_to_emoji(avg):
     if avg is None:
@@ -94,7 +328,13 @@ def grade_to_emoji(avg):
 # ────────────────────────────────────────────────
 
 if "data" not in st.session_state:
-    st.session_state.data = load_data()
+    st.session_state.data, st.session_state.revisions = load_data(database())
+
+if "data_version" not in st.session_state:
+    st.session_state.data_version = 0
+
+if "save_state" not in st.session_state:
+    st.session_state.save_state = {"dirty": False, "dirty_since": 0.0, "changed": set()}
 
 if "selected_student" not in st.session_state:
     st.session_state.selected_student = None
@@ -113,6 +353,25 @@ page = st.sidebar.radio("Navigation", [
     "📊 Statistiken"
 ])
 
+# Beim Seitenwechsel vorgemerkte Änderungen schreiben
+if st.session_state.get("current_page") != page:
+    flush_data()
+    st.session_state.current_page = page
+
+@st.fragment(run_every=AUTOSAVE_CHECK_SECONDS)
+def save_status():
+    """Speicherstatus in der Seitenleiste; läuft zusätzlich alle AUTOSAVE_CHECK_SECONDS"""
+    save_state = st.session_state.save_state
+    # Schon einen Takt vor Ablauf schreiben → spätestens nach AUTOSAVE_SECONDS gespeichert
+    if save_state["dirty"] and time.monotonic() - save_state["dirty_since"] >= AUTOSAVE_SECONDS - AUTOSAVE_CHECK_SECONDS:
+        flush_data()
+    if save_state["dirty"]:
+        st.warning("Ungespeicherte Änderungen – vor dem Neuladen oder Schließen des Tabs speichern")
+        st.button("💾 Speichern", on_click=flush_data)
+
+with st.sidebar:
+    save_status()
+
 # ────────────────────────────────────────────────
 #   Seite: Schülerübersicht
 # ────────────────────────────────────────────────
@@ -126,42 +385,39 @@ if page == "📋 Schülerübersicht":
     st.session_state.search_text = search.lower()
 
     # Tabelle vorbereiten
-    rows = []
-    for student_id, student in st.session_state.data.items():
-        name = student.get("name", "—")
-        class_ = student.get("class", "—")
-        avg = calculate_student_average(student.get("subjects", {}))
-        emoji = grade_to_emoji(avg)
-
-        if st.session_state.search_text and st.session_state.search_text not in name.lower():
-            continue
-
-        rows.append({
-            "ID": student_id,
-            "Name": name,
-            "Klasse": class_,
-            "Gesamtdurchschnitt": f"{avg:.2f} {emoji}" if avg else "—",
-            "⌀ numerisch": avg if avg else float("nan")
-        })
+    data = st.session_state.data
+    student_avgs = cached_student_averages()
+    search_text = st.session_state.search_text
+    if search_text:
+        matching_ids = [sid for sid, nl in cached_names_lower().items() if search_text in nl]
+    else:
+        matching_ids = list(data)
+
+    rows = [
+        (
+            sid,
+            data[sid].get("name", "—"),
+            data[sid].get("class", "—"),
+            f"{avg:.2f} {grade_to_emoji(avg)}" if avg else "—",
+            avg if avg else float("nan")
+        )
+        for sid, avg in zip(matching_ids, map(student_avgs.get, matching_ids))
+    ]
 
     if rows:
-        df = pd.DataFrame(rows)
+        df = pd.DataFrame.from_records(rows, columns=["ID", "Name", "Klasse", "Gesamtdurchschnitt", "⌀ numerisch"])
         df = df.sort_values("⌀ numerisch", ascending=True).reset_index(drop=True)
-        df_display = df.drop(columns=["⌀ numerisch"])
 
-        # Farbige Formatierung
-        def highlight_row(row):
-            styles = ["" for _ in row]
-            try:
-                val = float(row["Gesamtdurchschnitt"].split()[0])
-                styles[row.index.get_loc("Gesamtdurchschnitt")] = get_note_color(val)
-            except:
-                pass
+        # Farbige Formatierung – direkt aus der numerischen Spalte statt Text parsen
+        def highlight_avg(frame):
+            styles = pd.DataFrame("", index=frame.index, columns=frame.columns)
+            styles["Gesamtdurchschnitt"] = [get_note_color(v) if pd.notna(v) else "" for v in frame["⌀ numerisch"]]
             return styles
 
         st.dataframe(
-            df_display.style.apply(highlight_row, axis=1)
+            df.style.apply(highlight_avg, axis=None)
             .format({"Gesamtdurchschnitt": lambda x: x}, na_rep="—"),
+            column_config={"⌀ numerisch": None},
             use_container_width=True
         )
 
@@ -183,13 +439,12 @@ elif page == "✏️ Schüler & Noten bearbeiten":
     col1, col2 = st.columns([3,2])
 
     with col1:
-        student_names = {k: v["name"] for k,v in st.session_state.data.items()}
-        options = ["Neuen Schüler anlegen"] + [f"{name} ({k})" for k,name in student_names.items()]
+        options, option_index = cached_student_options()
 
         selected = st.selectbox(
             "Schüler auswählen oder neuen anlegen",
             options,
-            index=0 if not st.session_state.selected_student else options.index(next((f"{v['name']} ({k})" for k,v in st.session_state.data.items() if k == st.session_state.selected_student), 0))
+            index=option_index.get(st.session_state.selected_student, 0)
         )
 
         if selected == "Neuen Schüler anlegen":
@@ -209,7 +464,7 @@ elif page == "✏️ Schüler & Noten bearbeiten":
                             "subjects": {}
                         }
                         st.session_state.selected_student = new_id
-                        save_data(st.session_state.data)
+                        mark_dirty(new_id)
                         st.success(f"Schüler {new_name} angelegt!")
                         st.rerun()
 
@@ -231,7 +486,7 @@ elif page == "✏️ Schüler & Noten bearbeiten":
                     else:
                         student["name"] = new_name.strip()
                         student["class"] = new_class.strip()
-                        save_data(st.session_state.data)
+                        mark_dirty(student_id)
                         st.success("Daten aktualisiert")
                         st.rerun()
 
@@ -246,7 +501,7 @@ elif page == "✏️ Schüler & Noten bearbeiten":
                     if st.button("Ja, löschen"):
                         del st.session_state.data[student_id]
                         st.session_state.selected_student = None
-                        save_data(st.session_state.data)
+                        mark_dirty(student_id)
                         st.success("Schüler gelöscht")
                         st.rerun()
                 with col_no:
@@ -260,73 +515,77 @@ elif page == "✏️ Schüler & Noten bearbeiten":
 
             new_subject = st.text_input("Neues Fach hinzufügen", key=f"new_subj_{student_id}")
             if st.button("Fach hinzufügen") and new_subject.strip():
-                subj_key = new_subject.strip().lower().replace(" ", "_")
+                subj_key = sys.intern(new_subject.strip().lower().replace(" ", "_"))
                 if subj_key not in subjects:
-                    subjects[subj_key] = {"name": new_subject.strip(), "grades": []}
-                    save_data(st.session_state.data)
+                    subjects[subj_key] = {"name": sys.intern(new_subject.strip()), "grades": []}
+                    mark_dirty(student_id)
                     st.success(f"Fach '{new_subject}' hinzugefügt")
                 else:
                     st.warning("Fach existiert bereits")
                 st.rerun()
 
             # Fächer anzeigen
+            subject_avgs = cached_subject_averages()
             for subj_key, subj_data in list(subjects.items()):
-                with st.expander(f"{subj_data['name']} – ⌀ {calculate_subject_average(subj_data['grades']):.2f}" if subj_data['grades'] else f"{subj_data['name']} – keine Noten"):
+                subj_avg = subject_avgs.get((student_id, subj_key))
+                with st.expander(f"{subj_data['name']} – ⌀ {subj_avg:.2f}" if subj_avg is not None else f"{subj_data['name']} – keine Noten"):
                     col_del, col_rename = st.columns([1,4])
                     with col_del:
                         if st.button("×", key=f"del_subj_{student_id}_{subj_key}", help="Fach löschen"):
                             del subjects[subj_key]
-                            save_data(st.session_state.data)
+                            mark_dirty(student_id)
                             st.rerun()
 
                     grades = subj_data["grades"]
 
-                    # Notenliste
+                    # Notenliste – schlichte HTML-Tabelle statt pandas Styler pro Fach
                     if grades:
-                        grade_df = pd.DataFrame({
-                            "Note": [list(NOTE_TEXT_TO_DECIMAL.keys())[list(NOTE_TEXT_TO_DECIMAL.values()).index(g)] for g in grades],
-                            "Dezimal": grades
-                        })
-                        grade_df_styled = grade_df.style.applymap(
-                            lambda v: get_note_color(v) if isinstance(v, (int,float)) else "",
-                            subset=["Dezimal"]
+                        grade_rows = "".join(
+                            f"<tr><td>{DECIMAL_TO_NOTE[g]}</td><td style='{get_note_color(g)}'>{g:.1f}</td></tr>"
+                            for g in grades
+                        )
+                        st.markdown(
+                            f"<table><tr><th>Note</th><th>Dezimal</th></tr>{grade_rows}</table>",
+                            unsafe_allow_html=True
                         )
-                        st.dataframe(grade_df_styled, hide_index=True, use_container_width=True)
-
-                    # Note hinzufügen
-                    new_grade = st.selectbox("Note hinzufügen", ["—"] + ALL_GRADE_OPTIONS, key=f"add_grade_{student_id}_{subj_key}")
-                    if st.button("Note speichern", key=f"save_grade_{student_id}_{subj_key}") and new_grade != "—":
-                        grades.append(NOTE_TEXT_TO_DECIMAL[new_grade])
-                        save_data(st.session_state.data)
-                        st.rerun()
 
-                    # Bestehende Noten bearbeiten/löschen
-                    for i, grade in enumerate(grades):
-                        col_note, col_del = st.columns([4,1])
-                        with col_note:
-                            current_text = [k for k,v in NOTE_TEXT_TO_DECIMAL.items() if v == grade][0]
-                            edited = st.selectbox(
-                                f"Note {i+1}",
-                                ALL_GRADE_OPTIONS,
-                                index=ALL_GRADE_OPTIONS.index(current_text),
-                                key=f"edit_grade_{student_id}_{subj_key}_{i}"
+                    # Bearbeiten, Löschen (Zeilen-Menü der Tabelle) und Hinzufügen gesammelt
+                    # übernehmen → ein Rerun pro Klick statt einer pro Note
+                    form_key = f"{student_id}_{subj_key}_{st.session_state.data_version}"
+                    with st.form(f"subj_form_{student_id}_{subj_key}"):
+                        edited_grades = []
+                        if grades:
+                            edited_df = st.data_editor(
+                                pd.DataFrame({"Note": [DECIMAL_TO_NOTE[g] for g in grades]}),
+                                column_config={
+                                    "Note": st.column_config.SelectboxColumn("Note", options=ALL_GRADE_OPTIONS, required=True)
+                                },
+                                num_rows="dynamic",
+                                hide_index=True,
+                                use_container_width=True,
+                                # Version im Key → nach dem Übernehmen starten die Widgets frisch
+                                key=f"edit_grades_{form_key}"
                             )
-                            if edited != current_text:
-                                grades[i] = NOTE_TEXT_TO_DECIMAL[edited]
-                                save_data(st.session_state.data)
-                                st.rerun()
+                            edited_grades = [NOTE_TEXT_TO_DECIMAL[t] for t in edited_df["Note"].dropna()]
 
-                        with col_del:
-                            if st.button("×", key=f"del_grade_{student_id}_{subj_key}_{i}", help="Note löschen"):
-                                del grades[i]
-                                save_data(st.session_state.data)
-                                st.rerun()
+                        new_grade = st.selectbox("Note hinzufügen", ["—"] + ALL_GRADE_OPTIONS, key=f"add_grade_{form_key}")
+                        if new_grade != "—":
+                            edited_grades.append(NOTE_TEXT_TO_DECIMAL[new_grade])
+
+                        if st.form_submit_button("Noten übernehmen") and edited_grades != grades:
+                            grades[:] = edited_grades
+                            mark_dirty(student_id)
+                            st.rerun()
 
     with col2:
         st.markdown("**Hilfe / Tipps**")
         st.info(
             "• Noten immer über Dropdown eingeben → vermeidet Tippfehler\n"
-            "• Änderungen werden automatisch in **noten_db.json** gespeichert\n"
+            f"• Änderungen werden spätestens nach {AUTOSAVE_SECONDS} s, beim Seitenwechsel "
+            "oder mit **💾 Speichern** (Seitenleiste) in **noten_db.json** gesichert\n"
+            "• Neuladen oder Schließen des Tabs vorher kann ungespeicherte Änderungen verlieren: "
+            "die neue Sitzung sieht sie nicht, geschrieben werden sie erst beim Beenden des Servers "
+            "und nur, wenn niemand die Schüler inzwischen geändert hat\n"
             "• CSV-Export/-Import im Reiter Statistiken"
         )
 
@@ -341,20 +600,8 @@ elif page == "📊 Statistiken":
     if not st.session_state.data:
         st.info("Noch keine Daten vorhanden.")
     else:
-        all_grades = []
-        subject_grades = {}
-        student_avgs = []
-
-        for student in st.session_state.data.values():
-            subjs = student.get("subjects", {})
-            student_avg = calculate_student_average(subjs)
-            if student_avg is not None:
-                student_avgs.append(student_avg)
-
-            for subj_name, subj_data in subjs.items():
-                grades = subj_data.get("grades", [])
-                all_grades.extend(grades)
-                subject_grades.setdefault(subj_name, []).extend(grades)
+        student_avgs = [a for a in cached_student_averages().values() if a is not None]
+        grade_counts = cached_grade_counts()
 
         # Gesamtdurchschnitt
         if student_avgs:
@@ -362,15 +609,12 @@ elif page == "📊 Statistiken":
             st.metric("⌀ Gesamtdurchschnitt der Klasse", f"{total_avg:.2f} {grade_to_emoji(total_avg)}")
 
         # Notenverteilung
-        if all_grades:
-            grade_text_counts = {}
-            for g in all_grades:
-                text = [k for k,v in NOTE_TEXT_TO_DECIMAL.items() if v == g][0]
-                grade_text_counts[text] = grade_text_counts.get(text, 0) + 1
+        if grade_counts.any():
+            present = grade_counts > 0
 
             df_dist = pd.DataFrame({
-                "Note": list(grade_text_counts.keys()),
-                "Anzahl": list(grade_text_counts.values())
+                "Note": np.array(ALL_GRADE_OPTIONS)[present],
+                "Anzahl": grade_counts[present]
             }).sort_values("Note")
 
             fig = px.bar(df_dist, x="Note", y="Anzahl", title="Notenverteilung (alle Fächer)", text_auto=True)
@@ -381,22 +625,28 @@ elif page == "📊 Statistiken":
 
         # Export
         def convert_df_to_csv():
-            export_rows = []
+            # Spaltenweise sammeln statt ein dict pro Note
+            sids, names, classes, fachs, decimals = [], [], [], [], []
             for sid, s in st.session_state.data.items():
-                for subj_key, subj in s.get("subjects", {}).items():
-                    for grade in subj.get("grades", []):
-                        export_rows.append({
-                            "Schüler-ID": sid,
-                            "Name": s["name"],
-                            "Klasse": s.get("class",""),
-                            "Fach": subj["name"],
-                            "Note (Text)": [k for k,v in NOTE_TEXT_TO_DECIMAL.items() if v == grade][0],
-                            "Note (Dezimal)": grade
-                        })
-            df_export = pd.DataFrame(export_rows)
+                for subj in s.get("subjects", {}).values():
+                    grades = subj.get("grades", [])
+                    n = len(grades)
+                    sids.extend([sid] * n)
+                    names.extend([s["name"]] * n)
+                    classes.extend([s.get("class","")] * n)
+                    fachs.extend([subj["name"]] * n)
+                    decimals.extend(grades)
+            df_export = pd.DataFrame({
+                "Schüler-ID": sids,
+                "Name": names,
+                "Klasse": classes,
+                "Fach": fachs,
+                "Note (Text)": [DECIMAL_TO_NOTE[g] for g in decimals],
+                "Note (Dezimal)": np.array(decimals, dtype=float)
+            })
             return df_export.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
 
-        csv_data = convert_df_to_csv()
+        csv_data = versioned_cache("csv_cache", convert_df_to_csv)
         st.download_button(
             label="CSV exportieren (alle Daten)",
             data=csv_data,
@@ -413,24 +663,49 @@ elif page == "📊 Statistiken":
                 st.dataframe(df_import.head(8))
 
                 if st.button("**Import jetzt ausführen** (vorhandene Daten bleiben erhalten)"):
-                    for _, row in df_import.iterrows():
-                        sid = str(row["Schüler-ID"])
-                        if sid not in st.session_state.data:
-                            st.session_state.data[sid] = {
-                                "name": row["Name"],
-                                "class": row.get("Klasse",""),
-                                "subjects": {}
-                            }
-                        subj_name = row["Fach"]
-                        subj_key = subj_name.lower().replace(" ", "_")
-                        if subj_key not in st.session_state.data[sid]["subjects"]:
-                            st.session_state.data[sid]["subjects"][subj_key] = {"name": subj_name, "grades": []}
-                        try:
-                            decimal = NOTE_TEXT_TO_DECIMAL[row["Note (Text)"]]
-                            st.session_state.data[sid]["subjects"][subj_key]["grades"].append(decimal)
-                        except KeyError:
-                            st.warning(f"Ungültige Note übersprungen: {row['Note (Text)']}")
-                    save_data(st.session_state.data)
+                    data = st.session_state.data
+                    df_import["Schüler-ID"] = df_import["Schüler-ID"].astype(str)
+                    if "Klasse" not in df_import:
+                        df_import["Klasse"] = ""
+
+                    decimals = df_import["Note (Text)"].astype(str).map(NOTE_TEXT_TO_DECIMAL)
+                    invalid = df_import.loc[decimals.isna(), "Note (Text)"]
+                    if not invalid.empty:
+                        st.warning(f"Ungültige Noten übersprungen: {', '.join(map(str, invalid.unique()))}")
+                    missing_subject = df_import["Fach"].isna()
+                    if missing_subject.any():
+                        st.warning(f"Zeilen ohne Fach übersprungen: {missing_subject.sum()}")
+                    df_import["Note (Dezimal)"] = decimals
+
+                    # Erst alles vorbereiten – data wird erst geändert, wenn nichts mehr schiefgehen kann
+                    first_rows = df_import.drop_duplicates("Schüler-ID")
+                    new_students = {
+                        sid: {"name": name, "class": class_, "subjects": {}}
+                        for sid, name, class_ in zip(first_rows["Schüler-ID"],
+                                                     first_rows["Name"].astype(str),
+                                                     first_rows["Klasse"].fillna("").astype(str))
+                        if sid not in data
+                    }
+                    valid = df_import[decimals.notna() & ~missing_subject]
+                    grouped = (valid.assign(Fach=valid["Fach"].astype(str))
+                               .groupby(["Schüler-ID", "Fach"], sort=False)["Note (Dezimal)"]
+                               .agg(lambda s: s.tolist()))
+                    additions = [
+                        (sid, sys.intern(subj_name.lower().replace(" ", "_")), sys.intern(subj_name), new_grades)
+                        for (sid, subj_name), new_grades in grouped.items()
+                    ]
+
+                    # Neue Schüler anlegen (erste Zeile pro ID bestimmt Name/Klasse) und
+                    # Noten pro Schüler & Fach gesammelt anhängen
+                    data.update(new_students)
+                    for sid, subj_key, subj_name, new_grades in additions:
+                        subjects = data[sid]["subjects"]
+                        if subj_key not in subjects:
+                            subjects[subj_key] = {"name": subj_name, "grades": []}
+                        subjects[subj_key]["grades"].extend(new_grades)
+                    changed_ids = set(new_students).union(sid for sid, *_ in additions)
+                    if changed_ids:
+                        mark_dirty(*changed_ids)
                     st.success("Import abgeschlossen!")
                     st.rerun()
             except Exception as e: